@@ -1,8 +1,8 @@
 import os
-import toml
 from pathlib import Path
+import sys
 import typing
-from typing import List, Mapping, NoReturn, Optional, Type, TypeVar
+from typing import BinaryIO, Dict, List, Mapping, NoReturn, Optional, Type, TypeVar
 from .error import CandidateConstructionFailure
 
 T = TypeVar("T")
@@ -43,10 +43,22 @@ def merge_randomization_weights(
     return {key: overrides.get(key, weight) for key, weight in base.items()}
 
 
+def toml_load(f: BinaryIO) -> Dict[str, object]:
+    """Parse a TOML file, opened in binary mode."""
+    # Import lazily, so that modules that import this file but never read TOML
+    # (e.g. the network evaluator) don't need tomli on older Pythons.
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+
+    return tomllib.load(f)
+
+
 def get_default_randomization_weights(compiler_type: str) -> Mapping[str, float]:
     default_weights_file = Path(__file__).parent.parent / "default_weights.toml"
-    with open(default_weights_file) as f:
-        obj: Mapping[str, object] = toml.load(f)
+    with open(default_weights_file, "rb") as f:
+        obj: Mapping[str, object] = toml_load(f)
 
         base_weights = json_dict(json_prop(obj, "base", dict, {}), float)
 
@@ -61,8 +73,8 @@ def get_default_randomization_weights(compiler_type: str) -> Mapping[str, float]
 
 def get_settings(dir: str) -> Mapping[str, object]:
     try:
-        with open(os.path.join(dir, "settings.toml")) as f:
-            return toml.load(f)
+        with open(os.path.join(dir, "settings.toml"), "rb") as f:
+            return toml_load(f)
     except FileNotFoundError:
         return {}
 
@@ -410,15 +410,18 @@ def run_inner(options: Options, heartbeat: Callable[[], None]) -> List[int]:
         if options.use_network:
             # Importing the networking modules here so dependencies don't need to be loaded when not using the network mode
             from .net.client import start_client
-            from .net.core import ServerError, connect, enable_debug_mode
+            from .net.core import ServerError, connect, enable_debug_mode, read_config
 
             print("Connecting to permuter@home...")
             if options.network_debug:
                 enable_debug_mode()
             first_stats: Optional[Tuple[int, int, float]] = None
+            # Read the config (and decode the keys in it) once, and share it
+            # between all connections.
+            config = read_config()
             for perm_index in range(len(context.permuters)):
                 try:
-                    port = connect()
+                    port = connect(config)
                 except (EOFError, ServerError) as e:
                     print("Error:", e)
                     sys.exit(1)
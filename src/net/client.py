@@ -1,8 +1,6 @@
 from multiprocessing import Queue
-import re
 import threading
 from typing import Optional, Tuple
-import zlib
 
 from ..candidate import CandidateResult
 from ..helpers import exception_to_string, json_prop
@@ -22,6 +20,8 @@ from ..profiler import Profiler
 from .core import (
     PermuterData,
     SocketPort,
+    compress,
+    decompress,
     permuter_data_to_json,
 )
 
@@ -58,12 +58,13 @@ def _make_script_portable(source: str) -> str:
     directory similar to where import.py found its target's make root."""
     lines = []
     for line in source.split("\n"):
-        if re.match("cd '?/", line):
+        if line.startswith(("cd /", "cd '/")):
             # Skip cd's to absolute directory paths. Note that shlex quotes
             # its argument with ' if it contains spaces/single quotes.
             continue
-        if re.match("'?/", line):
-            quote = "'" if line[0] == "'" else ""
+        first = line[:1]
+        if first == "/" or (first == "'" and line[1:2] == "/"):
+            quote = "'" if first == "'" else ""
             ind = line.find(quote + " ")
             if ind == -1:
                 ind = len(line)
@@ -107,6 +108,7 @@ class Connection:
     _perm_index: int
     _task_queue: "Queue[Task]"
     _feedback_queue: "Queue[Feedback]"
+    _write_error: Optional[Exception]
 
     def __init__(
         self,
@@ -121,12 +123,13 @@ class Connection:
         self._perm_index = perm_index
         self._task_queue = task_queue
         self._feedback_queue = feedback_queue
+        self._write_error = None
 
     def _send_permuter(self) -> None:
         data = self._permuter_data
         self._port.send_json(permuter_data_to_json(data))
-        self._port.send(zlib.compress(data.source.encode("utf-8")))
-        self._port.send(zlib.compress(data.target_o_bin))
+        self._port.send(compress(data.source.encode("utf-8")))
+        self._port.send(compress(data.target_o_bin))
 
     def _feedback(self, feedback: FeedbackItem, server_nick: Optional[str]) -> None:
         self._feedback_queue.put((feedback, self._perm_index, server_nick))
@@ -165,7 +168,7 @@ class Connection:
                 # large (hundreds of kilobytes is not uncommon).
                 compressed_source = self._port.receive()
                 try:
-                    source = zlib.decompress(compressed_source).decode("utf-8")
+                    source = decompress(compressed_source).decode("utf-8")
                 except Exception as e:
                     text = "failed to decompress: " + exception_to_string(e)
                     self._feedback(Message(text), server_nick)
@@ -180,47 +183,65 @@ class Connection:
 
         raise ValueError(f"Invalid message type {msg_type}")
 
+    def _write_loop(self) -> None:
+        """Send tasks from the queue on to the server, until there are no more."""
+        try:
+            while True:
+                task = self._task_queue.get()
+                if isinstance(task, Finished):
+                    # We don't have a way of indicating to the server that all
+                    # is done: the server currently doesn't track outstanding
+                    # work so it doesn't know when to close the connection.
+                    # (Even with this fixed we'll have the problem that servers
+                    # may disconnect, losing work, so the task never truly
+                    # finishes. But it might work well enough in practice.)
+                    break
+                seed = task[1]
+                if not 0 <= seed < 2**64:
+                    # The controller only deals with 64-bit unsigned seeds.
+                    raise ValueError(f"seed {seed} is too large for permuter@home")
+                work = {
+                    "type": "work",
+                    "work": {
+                        "seed": seed,
+                    },
+                }
+                self._port.send_json(work)
+        except (EOFError, OSError):
+            # The connection broke or was closed from under us. Make sure the
+            # reading side notices, and let it report the disconnect.
+            self._port.shutdown()
+        except Exception as e:
+            # Something else went wrong. Stash the error for the reading side
+            # to report, and shut down the socket so that it notices.
+            self._write_error = e
+            self._port.shutdown()
+
     def run(self) -> None:
         finish_reason: Optional[str] = None
         try:
             self._send_permuter()
             self._port.receive_json()
 
-            finished = False
+            # Send tasks on a separate thread, so that sending and receiving
+            # don't have to wait for each other. The writer thread owns all
+            # sends from here on, and this thread all receives.
+            writer = threading.Thread(target=self._write_loop, daemon=True)
+            writer.start()
 
-            # Main loop: send messages from the queue on to the server, and
-            # vice versa. Currently we are being lazy and alternate between
-            # sending and receiving; this is nicely simple and keeps us on a
-            # single thread, however it could cause deadlocks if the server
-            # receiver stops reading because we aren't reading fast enough.
+            # Main loop: receive messages from the server and pass them on.
+            # Each time the server is ready for more work, ask for another
+            # task to be put into the queue for the writer thread.
             while True:
-                if not self._receive_one():
-                    continue
-                self._feedback(NeedMoreWork(), None)
-
-                # Read a task and send it on, unless there are no more tasks.
-                if not finished:
-                    task = self._task_queue.get()
-                    if isinstance(task, Finished):
-                        # We don't have a way of indicating to the server that
-                        # all is done: the server currently doesn't track
-                        # outstanding work so it doesn't know when to close
-                        # the connection. (Even with this fixed we'll have the
-                        # problem that servers may disconnect, losing work, so
-                        # the task never truly finishes. But it might work well
-                        # enough in practice.)
-                        finished = True
-                    else:
-                        work = {
-                            "type": "work",
-                            "work": {
-                                "seed": task[1],
-                            },
-                        }
-                        self._port.send_json(work)
+                if self._receive_one():
+                    self._feedback(NeedMoreWork(), None)
 
         except EOFError:
-            finish_reason = "disconnected from permuter@home"
+            if self._write_error is not None:
+                errmsg = exception_to_string(self._write_error)
+                finish_reason = f"permuter@home error: {errmsg}"
+            else:
+                finish_reason = "disconnected from permuter@home"
 
         except Exception as e:
             errmsg = exception_to_string(e)
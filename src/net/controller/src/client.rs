@@ -15,7 +15,7 @@ use crate::{
     State,
 };
 
-const MIN_PERMUTER_VERSION: u32 = 1;
+const MIN_PERMUTER_VERSION: u32 = 3;
 
 const CLIENT_MAX_QUEUES_SIZE: usize = 100;
 const MIN_PRIORITY: f64 = 0.001;
@@ -14,7 +14,7 @@ use crate::{
     ServerUpdate, State, HEARTBEAT_TIME,
 };
 
-const MIN_PERMUTER_VERSION: u32 = 1;
+const MIN_PERMUTER_VERSION: u32 = 3;
 
 const SERVER_WORK_QUEUE_SIZE: usize = 100;
 const TIME_US_GUESS: f64 = 100_000.0;
@@ -1,29 +1,69 @@
 import abc
 from dataclasses import dataclass
 import datetime
+import io
 import json
 import socket
 import struct
 import sys
-import toml
+import threading
 import typing
-from typing import BinaryIO, Dict, Mapping, Optional, Type, TypeVar, Union
-
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Mapping,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+    TYPE_CHECKING,
+)
+
+import nacl.bindings
 from nacl.encoding import HexEncoder
 from nacl.public import Box, PrivateKey, PublicKey
 from nacl.secret import SecretBox
 from nacl.signing import SigningKey, VerifyKey
 
+if TYPE_CHECKING:
+    from _typeshed import WriteableBuffer
+
 from ..error import ServerError
-from ..helpers import exception_to_string, json_prop, json_dict
+from ..helpers import exception_to_string, json_prop, json_dict, toml_load
+
+# orjson is optional, but speeds up the (de)serialization of network messages.
+try:
+    import orjson
+
+    def _json_dumps(obj: object) -> bytes:
+        return orjson.dumps(obj)
+
+    def _json_loads(data: bytes) -> object:
+        return orjson.loads(data)
+
+except ImportError:
+
+    def _json_dumps(obj: object) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    def _json_loads(data: bytes) -> object:
+        return json.loads(data)
+
 
 T = TypeVar("T")
 AnyBox = Union[Box, SecretBox]
 
-PERMUTER_VERSION = 2
+PERMUTER_VERSION = 3
 
 CONFIG_FILENAME = "pah.conf"
 
+# Precompiled formats for the per-message framing.
+_NONCE_STRUCT = struct.Struct(">16xQ")
+_LENGTH_STRUCT = struct.Struct(">Q")
+
+_SOCKET_READ_BUFFER_SIZE = 64 * 1024
+
 DEBUG_MODE = False
 
 
@@ -104,8 +144,8 @@ class Config:
 def read_config() -> Config:
     config = Config()
     try:
-        with open(CONFIG_FILENAME) as f:
-            obj = toml.load(f)
+        with open(CONFIG_FILENAME, "rb") as f:
+            obj = toml_load(f)
 
         def read(key: str, t: Type[T]) -> Optional[T]:
             ret = obj.get(key)
@@ -147,10 +187,64 @@ def write_config(config: Config) -> None:
         key_hex = config.signing_key.encode(HexEncoder)
         write("secret_key", key_hex.decode("utf-8"))
 
+    # Only needed for writing, which is rare, so import it lazily.
+    import toml
+
     with open(CONFIG_FILENAME, "w") as f:
         toml.dump(obj, f)
 
 
+class _ZstdContexts(threading.local):
+    # zstd contexts are expensive to set up, but can't be shared between
+    # threads, so we keep one pair per thread.
+    def __init__(self) -> None:
+        # Imported lazily, since most users of this module (e.g. `pah.py
+        # ping`) never compress anything.
+        import zstandard
+
+        self.compressor = zstandard.ZstdCompressor(level=3)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+
+# Upper limit on the size of decompressed blobs. zstd happily allocates
+# whatever size a frame header claims, so without a limit a tiny message could
+# make us allocate gigabytes.
+_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+_zstd_contexts: Optional[_ZstdContexts] = None
+_zstd_contexts_lock = threading.Lock()
+
+
+def _get_zstd_contexts() -> _ZstdContexts:
+    global _zstd_contexts
+    if _zstd_contexts is None:
+        with _zstd_contexts_lock:
+            if _zstd_contexts is None:
+                _zstd_contexts = _ZstdContexts()
+    return _zstd_contexts
+
+
+def compress(data: bytes) -> bytes:
+    """Compress a large binary blob (source code, object file) for sending
+    over the network."""
+    return _get_zstd_contexts().compressor.compress(data)
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompress a binary blob compressed by compress()."""
+    import zstandard
+
+    size = zstandard.frame_content_size(data)
+    if size > _MAX_DECOMPRESSED_SIZE:
+        raise ValueError(
+            f"Compressed data is too large when decompressed ({size} bytes)"
+        )
+    # max_output_size only applies to frames that don't record their size.
+    return _get_zstd_contexts().decompressor.decompress(
+        data, max_output_size=_MAX_DECOMPRESSED_SIZE
+    )
+
+
 def file_read_max(inf: BinaryIO, n: int) -> bytes:
     try:
         ret = []
@@ -200,6 +294,18 @@ def socket_shutdown(sock: socket.socket, how: int) -> None:
         pass
 
 
+def socket_quickack(sock: socket.socket) -> None:
+    """Ask the kernel to send ACKs immediately instead of delaying them, which
+    otherwise adds latency to our request/response traffic. Linux-only. The
+    kernel may turn quickack mode off again on its own, so this has to be
+    re-armed after reads."""
+    if hasattr(socket, "TCP_QUICKACK"):
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except OSError:
+            pass
+
+
 def sign_with_magic(magic: bytes, signing_key: SigningKey, data: bytes) -> bytes:
     signature: bytes = signing_key.sign(magic + b":" + data).signature
     return signature + data
@@ -216,13 +322,27 @@ def verify_with_magic(magic: bytes, verify_key: VerifyKey, data: bytes) -> bytes
 
 class Port(abc.ABC):
     def __init__(self, box: AnyBox, who: str, *, is_client: bool) -> None:
-        self._box = box
+        # Encrypt and decrypt using the low-level NaCl bindings, with the key
+        # (for Box, the precomputed shared key) passed in directly. The
+        # high-level encrypt() methods wrap their result in an EncryptedMessage,
+        # which costs an extra copy of every message.
+        self._key: bytes
+        self._encrypt: Callable[[bytes, bytes, bytes], bytes]
+        self._decrypt: Callable[[bytes, bytes, bytes], bytes]
+        if isinstance(box, Box):
+            self._key = box.shared_key()
+            self._encrypt = nacl.bindings.crypto_box_afternm
+            self._decrypt = nacl.bindings.crypto_box_open_afternm
+        else:
+            self._key = bytes(box)
+            self._encrypt = nacl.bindings.crypto_secretbox
+            self._decrypt = nacl.bindings.crypto_secretbox_open
         self._who = who
         self._send_nonce = 0 if is_client else 1
         self._receive_nonce = 1 if is_client else 0
 
     @abc.abstractmethod
-    def _send(self, data: bytes) -> None:
+    def _send(self, header: bytes, data: bytes) -> None:
         ...
 
     @abc.abstractmethod
@@ -240,18 +360,18 @@ class Port(abc.ABC):
                 debug_print(f"Send to {self._who}: {msg!r}")
             else:
                 debug_print(f"Send to {self._who}: {len(msg)} bytes")
-        nonce = struct.pack(">16xQ", self._send_nonce)
+        nonce = _NONCE_STRUCT.pack(self._send_nonce)
         self._send_nonce += 2
-        data = self._box.encrypt(msg, nonce).ciphertext
-        length_data = struct.pack(">Q", len(data))
+        data = self._encrypt(msg, nonce, self._key)
+        length_data = _LENGTH_STRUCT.pack(len(data))
         try:
-            self._send(length_data + data)
+            self._send(length_data, data)
         except BrokenPipeError:
             raise EOFError from None
 
     def send_json(self, msg: dict) -> None:
         """Send a message in the form of a JSON dict, potentially blocking."""
-        self.send(json.dumps(msg).encode("utf-8"))
+        self.send(_json_dumps(msg))
 
     def receive(self) -> bytes:
         """Read a binary message, blocking."""
@@ -263,11 +383,11 @@ class Port(abc.ABC):
             raise Exception(
                 f"Got unexpected data from {self._who}: " + repr(length_data)
             )
-        length = struct.unpack(">Q", length_data)[0]
+        length = _LENGTH_STRUCT.unpack(length_data)[0]
         data = self._receive(length)
-        nonce = struct.pack(">16xQ", self._receive_nonce)
+        nonce = _NONCE_STRUCT.pack(self._receive_nonce)
         self._receive_nonce += 2
-        msg: bytes = self._box.decrypt(data, nonce)
+        msg = self._decrypt(data, nonce, self._key)
         if DEBUG_MODE:
             if len(msg) <= 300:
                 debug_print(f"Receive from {self._who}: {msg!r}")
@@ -277,7 +397,7 @@ class Port(abc.ABC):
 
     def receive_json(self) -> dict:
         """Read a message in the form of a JSON dict, blocking."""
-        ret = json.loads(self.receive())
+        ret = _json_loads(self.receive())
         if isinstance(ret, str):
             # Raw strings indicate errors.
             raise ServerError(ret)
@@ -289,26 +409,69 @@ class Port(abc.ABC):
         return ret
 
 
+class _QuickAckSocketIO(socket.SocketIO):
+    """Raw reader for a socket, which re-arms TCP quickack mode each time it
+    actually receives data from the kernel.
+
+    This subclasses the undocumented socket.SocketIO, and is constructed
+    directly rather than via sock.makefile(). That deliberately skips
+    makefile()'s reference counting: closing the socket closes the file
+    descriptor right away, whether or not this reader is still open."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        super().__init__(sock, "rb")
+        self._quickack_sock = sock
+
+    def readinto(self, b: "WriteableBuffer") -> Optional[int]:
+        ret = super().readinto(b)
+        socket_quickack(self._quickack_sock)
+        return ret
+
+
 class SocketPort(Port):
     def __init__(
         self, sock: socket.socket, box: AnyBox, who: str, *, is_client: bool
     ) -> None:
         self._sock = sock
+        # Read through a buffer, so that a message's length header and its
+        # contents (and often several small messages) can be fetched using a
+        # single recv call, rather than one or more per read. Messages served
+        # from the buffer don't cost any syscalls, not even for quickack.
+        self._inf = typing.cast(
+            BinaryIO,
+            io.BufferedReader(_QuickAckSocketIO(sock), _SOCKET_READ_BUFFER_SIZE),
+        )
         super().__init__(box, who, is_client=is_client)
 
-    def _send(self, data: bytes) -> None:
-        self._sock.sendall(data)
+    def _send(self, header: bytes, data: bytes) -> None:
+        if not hasattr(self._sock, "sendmsg"):
+            # Windows doesn't support sendmsg.
+            self._sock.sendall(header + data)
+            return
+
+        # Send the header and data together without concatenating them, since
+        # data can be large. sendmsg may do a partial write, in which case we
+        # fall back to sendall for the rest.
+        sent = self._sock.sendmsg([header, data])
+        if sent < len(header):
+            self._sock.sendall(header[sent:])
+            sent = len(header)
+        if sent < len(header) + len(data):
+            self._sock.sendall(memoryview(data)[sent - len(header) :])
 
     def _receive(self, length: int) -> bytes:
-        return socket_read_fixed(self._sock, length)
+        return file_read_fixed(self._inf, length)
 
     def _receive_max(self, length: int) -> bytes:
-        return socket_read_max(self._sock, length)
+        return file_read_max(self._inf, length)
 
     def shutdown(self, how: int = socket.SHUT_RDWR) -> None:
         socket_shutdown(self._sock, how)
 
     def close(self) -> None:
+        # Closing the socket closes the file descriptor by itself; the reader
+        # is closed just to release it.
+        self._inf.close()
         self._sock.close()
 
 
@@ -320,7 +483,8 @@ class FilePort(Port):
         self._outf = outf
         super().__init__(box, who, is_client=is_client)
 
-    def _send(self, data: bytes) -> None:
+    def _send(self, header: bytes, data: bytes) -> None:
+        self._outf.write(header)
         self._outf.write(data)
         self._outf.flush()
 
@@ -354,6 +518,11 @@ def _do_connect(config: Config) -> SocketPort:
     except Exception as e:
         raise EOFError("unable to connect: " + exception_to_string(e)) from None
 
+    # Messages are small and latency-sensitive, so disable Nagle's algorithm
+    # and delayed ACKs.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    socket_quickack(sock)
+
     # Send over the protocol version and an ephemeral encryption key which we
     # are going to use for all communication.
     ephemeral_key = PrivateKey.generate()
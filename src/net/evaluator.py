@@ -12,7 +12,6 @@ import threading
 import time
 import traceback
 from typing import Counter, Dict, List, Mapping, Optional, Set, Tuple, Union
-import zlib
 
 from nacl.secret import SecretBox
 
@@ -31,6 +30,7 @@ from .core import (
     FilePort,
     PermuterData,
     Port,
+    compress,
     json_prop,
     permuter_data_from_json,
 )
@@ -223,7 +223,7 @@ def multiprocess_worker(
         if isinstance(result, CandidateResult):
             compressed_source: Optional[bytes] = None
             if result.source is not None:
-                compressed_source = zlib.compress(result.source.encode("utf-8"))
+                compressed_source = compress(result.source.encode("utf-8"))
             setattr(result, "compressed_source", compressed_source)
             result.source = None
 
@@ -8,7 +8,6 @@ import threading
 import time
 import traceback
 from typing import BinaryIO, Dict, Optional, Set, Tuple, Union, TYPE_CHECKING
-import zlib
 
 if TYPE_CHECKING:
     import docker
@@ -31,6 +30,7 @@ from .core import (
     ServerError,
     SocketPort,
     connect,
+    decompress,
     file_read_fixed,
     permuter_data_from_json,
     permuter_data_to_json,
@@ -39,6 +39,8 @@ from .core import (
 
 _HEARTBEAT_INTERVAL_SLACK_SEC: float = 50.0
 
+_DOCKER_HEADER_STRUCT = struct.Struct(">BxxxI")
+
 
 @dataclass
 class Client:
@@ -306,8 +308,8 @@ class NetThread:
             compressed_target_o_bin = self._port.receive()
 
             try:
-                source = zlib.decompress(compressed_source).decode("utf-8")
-                target_o_bin = zlib.decompress(compressed_target_o_bin)
+                source = decompress(compressed_source).decode("utf-8")
+                target_o_bin = decompress(compressed_target_o_bin)
                 permuter = permuter_data_from_json(data, source, target_o_bin)
             except Exception as e:
                 # Client sent something illegible. This can legitimately happen if the
@@ -788,7 +790,7 @@ class DockerPort(Port):
 
     def _read_one(self) -> None:
         header = file_read_fixed(self._sock, 8)
-        stream, length = struct.unpack(">BxxxI", header)
+        stream, length = _DOCKER_HEADER_STRUCT.unpack(header)
         if stream not in [1, 2]:
             raise Exception("Unexpected output from Docker: " + repr(header))
         data = file_read_fixed(self._sock, length)
@@ -811,10 +813,12 @@ class DockerPort(Port):
         self._stdout_buffer = self._stdout_buffer[length:]
         return ret
 
-    def _send(self, data: bytes) -> None:
-        while data:
-            written = self._sock.write(data)
-            data = data[written:]
+    def _send(self, header: bytes, data: bytes) -> None:
+        for chunk in [header, data]:
+            view = memoryview(chunk)
+            while view:
+                written = self._sock.write(view)
+                view = view[written:]
         self._sock.flush()
 
 